@@ -1,4 +1,9 @@
-import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order, minimum_spanning_tree
+from scipy.spatial import cKDTree
+
+from utils import haversine_prepared, prepare_points, project_to_local_meters, projection_search_radius
 
 MIN_POLE_TO_TERMINAL = 10.0
 MAX_POLE_TO_TERMINAL = 100.0
@@ -7,100 +12,190 @@ MIN_POLE_TO_POLE = 10.0
 MAX_POLE_TO_POLE = 150.0
 
 
-def build_directed_graph_for_arborescence(
+def build_candidate_edges(
         source_idx,
         terminal_indices,
         pole_indices,
-        dist_matrix,
+        coords,
         costs,
-) -> nx.DiGraph:
+):
     """
-    Builds a directed graph for use in finding a minimum-cost arborescence given
-    a set of coordinates, indices, and constraints.
+    Builds the list of every candidate connection between the source, poles and terminals,
+    given the node coordinates and constraints.
+
+    Only pairs within the maximum span for their edge type can ever be connected, so instead of
+    a dense all-pairs distance matrix, KD-tree radius searches on locally projected coordinates
+    collect the nearby pairs and exact haversine distances are computed for those pairs only.
 
-    This function constructs a directed graph where poles and terminals are represented
-    as nodes, and edges represent potential connections between them. Different weight
-    and voltage attributes are applied to the edges depending on their type (pole-to-terminal,
-    pole-to-pole, or source-to-pole/terminal connections).
+    Each feasible connection is emitted exactly once, as parallel arrays rather than graph
+    objects so the MST can be solved directly on them. The voltage identifies the edge type:
+    "low" for pole-to-terminal service drops (always stored pole first) and "high" for
+    pole-to-pole spans and source-to-pole trunk connections.
 
     Args:
         source_idx: Integer index representing the source node (e.g., a substation).
         terminal_indices: List of integers representing indices of all terminals.
         pole_indices: List of integers representing indices of all poles.
-        dist_matrix: 2D matrix where each element represents the distance between nodes.
+        coords: (n, 2) array of [lat, lon] for every node index.
         costs: Dictionary storing cost values for graph construction. Specifically,
                it should include the `"poleCost"` key to determine the cost addition
                for pole-to-pole connections.
 
     Returns:
-        nx.DiGraph: A directed graph with the defined nodes and edges.
+        Tuple of equal-length arrays (u, v, weight, length, voltage), one entry per edge.
 
     """
     # pole_cost = float(costs.get("poleCost", 1000.0))
     # low_voltage_cost_per_meter = float(costs.get("lowVoltageCostPerMeter", 4.0))
     # high_voltage_cost_per_meter = float(costs.get("highVoltageCostPerMeter", 10.0))
 
-    DG = nx.DiGraph()
-
-    # Directed: poles → terminals (service drops)
-    for p in pole_indices:
-        for h in terminal_indices:
-            d = dist_matrix[p, h]
-            if 0.1 < d <= MAX_POLE_TO_TERMINAL:
-                w = d  # TODO: Adjust weight based on costs
-                DG.add_edge(p, h, weight=w, length=d, voltage="low")
-
-    # Bidirectional pole ↔ pole (undirected spans)
-    for i in range(len(pole_indices)):
-        for j in range(i + 1, len(pole_indices)):
-            p1, p2 = pole_indices[i], pole_indices[j]
-            d = dist_matrix[p1, p2]
-            w = d + 100 # TODO: Adjust weight based on costs
-            if 0.1 < d <= MAX_POLE_TO_POLE:
-                DG.add_edge(p1, p2, weight=w, length=d, voltage="high")
-                DG.add_edge(p2, p1, weight=w, length=d, voltage="high")
-
-    # Directed: source → poles (main trunk)
-    for p in pole_indices:
-        d = dist_matrix[source_idx, p]
-        if 0.1 < d <= MAX_POLE_TO_POLE:
-            w = d  # TODO: Adjust weight based on costs
-            DG.add_edge(source_idx, p, weight=w, length=d, voltage="high")
-
-    return DG
-
-
-def prune_dead_end_pole_branches(arbo: nx.DiGraph, pole_indices: list, terminal_indices) -> nx.DiGraph:
+    poles = np.asarray(pole_indices, dtype=np.int64)
+    terminals = np.asarray(terminal_indices, dtype=np.int64)
+
+    points = prepare_points(coords)
+
+    # Searches run on projected meters with widened radii; exact distances filter the results
+    xy = project_to_local_meters(coords)
+    pole_tree = cKDTree(xy[poles])
+
+    # Poles → terminals (service drops)
+    near = pole_tree.sparse_distance_matrix(
+        cKDTree(xy[terminals]), projection_search_radius(coords, MAX_POLE_TO_TERMINAL), output_type="ndarray"
+    )
+    near = near[np.lexsort((near["j"], near["i"]))]
+    pi, ti = near["i"], near["j"]
+    drop_d = haversine_prepared(points, poles[pi], terminals[ti])
+    # No lower bound: a candidate may sit on a terminal (a Fermat point at a vertex of ≥120°)
+    # and then serves it through a zero-length drop when no other pole can
+    drop_mask = drop_d <= MAX_POLE_TO_TERMINAL
+    pi, ti, drop_d = pi[drop_mask], ti[drop_mask], drop_d[drop_mask]
+    drop_w = drop_d  # TODO: Adjust weight based on costs
+
+    # Pole – pole (spans), each pair once with i < j
+    pairs = pole_tree.query_pairs(projection_search_radius(coords, MAX_POLE_TO_POLE), output_type="ndarray")
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    iu, ju = pairs[:, 0], pairs[:, 1]
+    span_d = haversine_prepared(points, poles[iu], poles[ju])
+    span_mask = (span_d > 0.1) & (span_d <= MAX_POLE_TO_POLE)
+    iu, ju, span_d = iu[span_mask], ju[span_mask], span_d[span_mask]
+    span_w = span_d + 100  # TODO: Adjust weight based on costs
+
+    # Source – poles (main trunk)
+    trunk_near = pole_tree.query_ball_point(
+        xy[source_idx], projection_search_radius(coords, MAX_POLE_TO_POLE)
+    )
+    trunk_near = np.sort(np.asarray(trunk_near, dtype=np.int64))
+    d_sp = haversine_prepared(points, source_idx, poles[trunk_near])
+    # No lower bound: a candidate may sit on the source itself (a Fermat point at a vertex of
+    # ≥120°) and is then fed through a zero-length trunk edge
+    trunk_mask = d_sp <= MAX_POLE_TO_POLE
+    trunk_poles, trunk_d = poles[trunk_near[trunk_mask]], d_sp[trunk_mask]
+    trunk_w = trunk_d  # TODO: Adjust weight based on costs
+
+    u = np.concatenate([poles[pi], poles[iu], np.full(len(trunk_poles), source_idx, dtype=np.int64)])
+    v = np.concatenate([terminals[ti], poles[ju], trunk_poles])
+    weight = np.concatenate([drop_w, span_w, trunk_w]).astype(np.float64)
+    length = np.concatenate([drop_d, span_d, trunk_d]).astype(np.float64)
+    voltage = np.repeat(np.array(["low", "high"], dtype="U4"), [len(drop_d), len(span_d) + len(trunk_d)])
+
+    return u, v, weight, length, voltage
+
+
+def build_rooted_mst(edges, num_nodes: int, source_idx):
+    """
+    Computes the minimum-cost tree rooted at the source from the candidate edge arrays.
+
+    Terminals only ever receive a service drop, so they are leaves of any valid tree. This lets
+    the problem split in two: the trunk (source and poles, "high" edges) is solved as an
+    undirected MST with SciPy's compiled csgraph routines and oriented away from the source by
+    BFS, then every terminal is attached through its cheapest drop from a pole reached by the
+    trunk. The result is the same minimum-cost arborescence Edmonds' algorithm finds on the
+    equivalent directed graph, except that a zero-length drop from a pole standing on the
+    terminal is only used when no other drop reaches it.
+
+    The tree is returned as flat arrays indexed by child node: every node has at most one
+    incoming edge, so a parent vector describes it completely.
+
+    Args:
+        edges: Tuple of arrays (u, v, weight, length, voltage) from `build_candidate_edges`.
+        num_nodes (int): Total number of nodes (terminals, source and candidate poles).
+        source_idx: Integer index of the source node (root of the tree).
+
+    Returns:
+        Tuple (parent, edge_length, edge_voltage) of arrays of length `num_nodes`. parent[n] is
+        the node feeding n, or -1 for the source and nodes not in the tree; edge_length[n] and
+        edge_voltage[n] describe the edge parent[n] → n.
+    """
+    u, v, weight, length, voltage = edges
+    high = np.flatnonzero(voltage == "high")
+    low = np.flatnonzero(voltage == "low")
+
+    # ─── Trunk: undirected MST over source + poles, rooted by BFS ───────────
+    # csgraph drops zero entries, so weights are offset to keep zero-length trunk edges; adding
+    # a constant to every edge does not change which spanning tree is minimal
+    W = csr_matrix((weight[high] + 1.0, (u[high], v[high])), shape=(num_nodes, num_nodes))
+    # Edge ids (offset by 1 so that 0 stays "no edge") to recover attributes of tree edges
+    E = csr_matrix((high + 1, (u[high], v[high])), shape=(num_nodes, num_nodes))
+    E = E + E.T
+
+    T = minimum_spanning_tree(W)
+    order, pred = breadth_first_order(T, source_idx, directed=False, return_predecessors=True)
+    children = order[1:]
+    parents = pred[children]
+    tree_ids = np.asarray(E[parents, children]).ravel() - 1 if len(children) else children
+
+    reached = np.zeros(num_nodes, dtype=bool)
+    reached[order] = True
+
+    # ─── Service drops: cheapest edge from a reached pole per terminal ──────
+    low = low[reached[u[low]]]
+    # A pole standing on its terminal is only the last resort: weights carry no pole cost, so
+    # preferring that 0 m drop would keep an extra pole wherever another pole already serves it
+    colocated = length[low] <= 0.1
+    low = low[np.lexsort((weight[low], colocated, v[low]))]
+    _, first = np.unique(v[low], return_index=True)
+    drop_ids = low[first]
+
+    parent = np.full(num_nodes, -1, dtype=np.int64)
+    edge_length = np.zeros(num_nodes, dtype=np.float64)
+    edge_voltage = np.full(num_nodes, "", dtype="U4")
+
+    parent[children] = parents
+    edge_length[children] = length[tree_ids]
+    edge_voltage[children] = voltage[tree_ids]
+
+    drop_terminals = v[drop_ids]
+    parent[drop_terminals] = u[drop_ids]
+    edge_length[drop_terminals] = length[drop_ids]
+    edge_voltage[drop_terminals] = voltage[drop_ids]
+
+    return parent, edge_length, edge_voltage
+
+
+def prune_dead_end_pole_branches(parent: np.ndarray, terminal_indices) -> np.ndarray:
     """
-    Prunes dead-end pole branches in a Directed Graph (DiGraph).
+    Prunes dead-end pole branches from a tree given as a parent vector.
 
-    This function removes leaf nodes in the provided graph that represent poles and do not serve
-    any terminal nodes in their subtree. The pruning process continues iteratively until no such
-    dead-end poles remain in the graph. It modifies a copy of the input graph without affecting
-    the original.
+    This function removes pole nodes that do not serve any terminal node in their subtree.
+    Walking up from every connected terminal marks the nodes on its path to the source; a
+    walk stops as soon as it meets a node that is already marked, so each node is visited
+    once. Every unmarked node still in the tree can only be a pole on a dead-end branch and is
+    detached. It returns a new parent vector without affecting the original.
 
     Args:
-        arbo (nx.DiGraph): A directed graph representing the network structure.
-        pole_indices (list): A list of node indices representing poles in the graph.
+        parent (np.ndarray): Parent vector from `build_rooted_mst` (-1 for no parent).
         terminal_indices (list): A list of node indices representing terminals in the graph.
 
     Returns:
-        nx.DiGraph: A new directed graph with dead-end pole branches removed.
+        np.ndarray: A new parent vector with dead-end pole branches detached (set to -1).
     """
-    arbo = arbo.copy()
-    removed = True
-    while removed:
-        removed = False
-        leaves = [n for n in arbo.nodes() if arbo.out_degree(n) == 0]
-        for leaf in leaves:
-            if leaf in pole_indices:
-                # Check if this leaf (or its subtree) serves any terminal
-                descendants = nx.descendants(arbo, leaf) | {leaf}
-                if not any(d in terminal_indices for d in descendants):
-                    # No terminal served → safe to remove
-                    predecessors = list(arbo.predecessors(leaf))
-                    for pred in predecessors:
-                        arbo.remove_edge(pred, leaf)
-                    arbo.remove_node(leaf)
-                    removed = True
-    return arbo
+    serves_terminal = np.zeros(len(parent), dtype=bool)
+    for h in terminal_indices:
+        if parent[h] < 0:
+            continue
+        node = h
+        while node >= 0 and not serves_terminal[node]:
+            serves_terminal[node] = True
+            node = parent[node]
+
+    return np.where(serves_terminal, parent, -1)
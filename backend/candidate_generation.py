@@ -1,17 +1,67 @@
-from scipy.spatial import Voronoi, Delaunay
+from functools import lru_cache
+
+from scipy.spatial import Voronoi, Delaunay, cKDTree
 import pandas as pd
 
-from shapely.geometry import Point
+import shapely
+from shapely.strtree import STRtree
 from shapely.wkt import loads
 
 from utils import *
 
 
 # For Voronoi candidates:
-MIN_DIST_TO_TERMINAL = 8.0,
+MIN_DIST_TO_TERMINAL = 8.0
 MAX_CIRCUMRADIUS = 300.0
 MIN_CANDIDATE_SEPARATION = 10.0
 
+# Building footprints used by filter_candidates_by_buildings
+BUILDINGS_CSV = "179_buildings.csv"
+
+
+def enforce_min_separation(
+        candidates: np.ndarray,
+        min_separation: float = MIN_CANDIDATE_SEPARATION
+) -> np.ndarray:
+    """
+    Greedily removes candidates closer than `min_separation` meters to an already kept one.
+
+    Candidates are visited in latitude order (somewhat spatial, helps the greedy algorithm).
+    Instead of testing every candidate against all kept ones, a single KD-tree pair query on
+    locally projected coordinates finds the few pairs that are close enough to conflict, and
+    the greedy decision is replayed over those pairs only.
+
+    Args:
+        candidates: (m, 2) array of candidate points [lat, lon]
+        min_separation: minimum distance in meters between two kept candidates
+
+    Returns:
+        np.ndarray: kept candidates (k, 2), sorted by latitude
+    """
+    if len(candidates) <= 1:
+        return candidates
+
+    # Sort by latitude for somewhat spatial order (helps greedy algorithm)
+    candidates = candidates[np.argsort(candidates[:, 0])]
+
+    # Conflicting pairs (i < j in visiting order) within the exact haversine separation
+    xy = project_to_local_meters(candidates)
+    pairs = cKDTree(xy).query_pairs(
+        projection_search_radius(candidates, min_separation), output_type="ndarray"
+    )
+    dists = haversine_prepared(prepare_points(candidates), pairs[:, 0], pairs[:, 1])
+    conflicts = pairs[dists < min_separation]
+
+    # Greedy filter: keep point only if >= MIN distance from all kept points.
+    # Processing conflicts by their later point means every earlier point's fate is already
+    # settled when it is consulted.
+    kept = np.ones(len(candidates), dtype=bool)
+    for earlier, later in conflicts[np.argsort(conflicts[:, 1], kind="stable")].tolist():
+        if kept[earlier]:
+            kept[later] = False
+
+    return candidates[kept]
+
 
 def generate_voronoi_candidates(coords: np.ndarray) -> np.ndarray:
     """
@@ -27,10 +77,21 @@ def generate_voronoi_candidates(coords: np.ndarray) -> np.ndarray:
 
     verts = vor.vertices  # shape (n_vertices, 2)
 
-    # Vectorized haversine distances from vertices to original points
-    dists = haversine_vec(verts, coords)  # assume you have this function
+    # Three nearest original points per vertex, from a KD-tree in local meters
+    # (equirectangular around the site matches haversine closely at this scale)
+    origin = coords.mean(axis=0)
+    tree = cKDTree(project_to_local_meters(coords, origin))
+    _, nearest_idx = tree.query(project_to_local_meters(verts, origin), k=3)
+
+    # Exact haversine on just those three pairs so the thresholds apply to true distances
+    P = prepare_points(coords)
+    V = prepare_points(verts)
+    nearest_dists = haversine_from_radians(
+        V.lat[:, None], V.lng[:, None], V.cos_lat[:, None],
+        P.lat[nearest_idx], P.lng[nearest_idx], P.cos_lat[nearest_idx],
+    )
+    nearest_dists.sort(axis=1)
 
-    nearest_dists = np.partition(dists, 2, axis=1)[:, :3]
     min_dists = nearest_dists[:, 0]
     third_min_dists = nearest_dists[:, 2]
 
@@ -46,35 +107,19 @@ def generate_voronoi_candidates(coords: np.ndarray) -> np.ndarray:
         return candidates
 
     # ─── Step 1: Deduplicate with rounding (existing) ───────────────────────
-    candidates = np.unique(np.round(candidates, decimals=6), axis=0)
+    # Sort rows by (lat, lon) and drop rows equal to their predecessor
+    candidates = np.round(candidates, decimals=6)
+    candidates = candidates[np.lexsort((candidates[:, 1], candidates[:, 0]))]
+    is_new = np.ones(len(candidates), dtype=bool)
+    is_new[1:] = np.any(candidates[1:] != candidates[:-1], axis=1)
+    candidates = candidates[is_new]
 
     if len(candidates) <= 1:
         print(f"Generated {len(candidates)} unique Voronoi candidate poles")
         return candidates
 
     # ─── Step 2: Enforce minimum separation (new) ───────────────────────────
-    # Sort by latitude for somewhat spatial order (helps greedy algorithm)
-    sort_idx = np.argsort(candidates[:, 0])
-    candidates = candidates[sort_idx]
-
-    # Greedy filter: keep point only if >= MIN distance from all kept points
-    kept = []
-    kept_array = np.empty((0, 2))
-
-    for pt in candidates:
-        if len(kept_array) == 0:
-            kept.append(pt)
-            kept_array = np.array([pt])
-            continue
-
-        # Compute distances to already kept points
-        dists_to_kept = haversine_vec(np.array([pt]), kept_array)[0]
-
-        if np.all(dists_to_kept >= MIN_CANDIDATE_SEPARATION):
-            kept.append(pt)
-            kept_array = np.vstack([kept_array, pt])
-
-    candidates = np.array(kept)
+    candidates = enforce_min_separation(candidates)
 
     print(f"Generated {len(candidates)} Voronoi candidate poles "
           f"after min {MIN_CANDIDATE_SEPARATION}m separation filter "
@@ -150,32 +195,47 @@ def generate_fermat_candidates(coords: np.ndarray, max_candidates: int = 30) ->
 
     candidates = np.array(candidates)
 
-    # Optional: apply your existing separation filter
-    # (you can reuse the same greedy logic from generate_voronoi_candidates)
-    if len(candidates) > 1:
-        sort_idx = np.argsort(candidates[:, 0])
-        candidates = candidates[sort_idx]
+    # Same greedy separation filter as generate_voronoi_candidates
+    candidates = enforce_min_separation(candidates)
 
-        kept = []
-        kept_array = np.empty((0, 2))
+    print(f"Generated {len(candidates)} Fermat-Steiner candidate poles "
+          f"(limited to {max_candidates}, after min separation filter)")
 
-        for pt in candidates:
-            if len(kept_array) == 0:
-                kept.append(pt)
-                kept_array = np.array([pt])
-                continue
+    return candidates
 
-            dists_to_kept = haversine_vec(np.array([pt]), kept_array)[0]
-            if np.all(dists_to_kept >= MIN_CANDIDATE_SEPARATION):
-                kept.append(pt)
-                kept_array = np.vstack([kept_array, pt])
 
-        candidates = np.array(kept)
+@lru_cache(maxsize=None)
+def load_buildings(path: str = BUILDINGS_CSV):
+    """
+    Read and parse a building footprint CSV once per process.
 
-    print(f"Generated {len(candidates)} Fermat-Steiner candidate poles "
-          f"(limited to {max_candidates}, after min separation filter)")
+    WKT parsing dominates the cost of filter_candidates_by_buildings, so the parsed, validated
+    and prepared polygons are cached and shared by every later request. Callers must not
+    modify the returned arrays.
 
-    return candidates
+    Args:
+        path: CSV with 'latitude', 'longitude' (footprint centroid) and WKT 'geometry' columns
+
+    Returns:
+        tuple: (latitudes, longitudes, polygons) arrays over the valid footprints
+    """
+    df = pd.read_csv(path, usecols=['latitude', 'longitude', 'geometry'])
+
+    # Drop rows missing required columns
+    df = df.dropna(subset=['latitude', 'longitude', 'geometry'])
+
+    polygons = np.asarray(df['geometry'].apply(loads).values)
+
+    # Drop invalid geometries
+    valid = shapely.is_valid(polygons)
+    polygons = polygons[valid]
+    shapely.prepare(polygons)
+
+    return (
+        df['latitude'].to_numpy(dtype=np.float64)[valid],
+        df['longitude'].to_numpy(dtype=np.float64)[valid],
+        polygons,
+    )
 
 
 def filter_candidates_by_buildings(
@@ -186,8 +246,9 @@ def filter_candidates_by_buildings(
     """
     1. Compute bounding box from candidates (with small padding)
     2. Keep only buildings whose CENTROID is INSIDE that bounding box
-    3. Parse geometry → shapely Polygon for those buildings only
-    4. Remove candidates that lie inside any of those building polygons
+    3. Remove candidates that lie inside any of those building polygons
+
+    Building polygons are parsed once per process by load_buildings.
 
     Returns filtered candidates as numpy array (n, 2)
     """
@@ -214,56 +275,42 @@ def filter_candidates_by_buildings(
           f"lat [{min_lat:.8f}, {max_lat:.8f}], "
           f"lon [{min_lon:.8f}, {max_lon:.8f}]")
 
-    # ─── 2. Load CSV and filter buildings by centroid inside bbox ────────
-    df = pd.read_csv("179_buildings.csv", usecols=['latitude', 'longitude', 'geometry'])
-
-    # Drop rows missing required columns
-    df = df.dropna(subset=['latitude', 'longitude', 'geometry'])
+    # ─── 2. Filter cached buildings by centroid inside bbox ──────────────
+    centroid_lats, centroid_lons, polygons = load_buildings()
 
     # Keep only buildings whose centroid is inside the bbox
     inside_mask = (
-            (df['latitude'] >= min_lat) & (df['latitude'] <= max_lat) &
-            (df['longitude'] >= min_lon) & (df['longitude'] <= max_lon)
+            (centroid_lats >= min_lat) & (centroid_lats <= max_lat) &
+            (centroid_lons >= min_lon) & (centroid_lons <= max_lon)
     )
 
-    df_filtered = df[inside_mask].copy()
+    polygons = polygons[inside_mask]
 
-    if df_filtered.empty:
-        print("No building centroids inside coords bbox → all candidates kept")
+    if len(polygons) == 0:
+        print("No valid building centroids inside coords bbox → all candidates kept")
         return candidates
 
-    print(f"Found {len(df_filtered)} buildings with centroid inside bbox")
+    print(f"Found {len(polygons)} valid buildings with centroid inside bbox")
 
-    # ─── 3. Parse geometry for the filtered buildings only ───────────────
-    df_filtered['poly'] = df_filtered['geometry'].apply(loads)
+    # ─── 3. Remove candidates inside any remaining building polygon ──────
+    candidates = np.asarray(candidates, dtype=np.float64).reshape(-1, 2)
 
-    # Drop invalid geometries
-    df_filtered = df_filtered[df_filtered['poly'].apply(lambda g: g.is_valid if g else False)]
-
-    if df_filtered.empty:
-        print("No valid building polygons after filtering → all candidates kept")
-        return candidates
+    lons, lats = candidates[:, 1], candidates[:, 0]  # shapely uses (x=lon, y=lat)
 
-    # ─── 4. Remove candidates inside any remaining building polygon ──────
-    polygons = df_filtered['poly'].values
+    # One batched STRtree query finds the (candidate, polygon) pairs whose envelopes overlap
+    tree = STRtree(polygons)
+    pt_idx, poly_idx = tree.query(shapely.points(lons, lats))
 
-    def is_covered(lat: float, lon: float) -> bool:
-        pt = Point(lon, lat)  # shapely uses (x=lon, y=lat)
-        for poly in polygons:
-            if poly.contains(pt):
-                return True
-        return False
+    # Exact test on raw coordinates against the prepared polygons
+    inside = shapely.contains_xy(polygons[poly_idx], lons[pt_idx], lats[pt_idx])
 
-    # Vectorized-ish check (still loop, but only over relevant buildings)
     keep_mask = np.ones(len(candidates), dtype=bool)
-    for i, (lat, lon) in enumerate(candidates):
-        if is_covered(lat, lon):
-            keep_mask[i] = False
+    keep_mask[pt_idx[inside]] = False
 
     filtered = candidates[keep_mask]
 
     removed = len(candidates) - len(filtered)
-    removed_nodes = [c for c in candidates if c not in filtered]
+    removed_nodes = candidates[~keep_mask].tolist()
     if removed > 0:
         print(f"Removed {removed} candidates inside building footprints: {removed_nodes}")
 
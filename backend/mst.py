@@ -1,10 +1,16 @@
 # backend/mst.py
-from scipy.spatial.distance import cdist
-
 from candidate_generation import *
 from build_graph import *
 
 
+class InfeasibleNetworkError(ValueError):
+    """Raised when the input layout cannot be served within the span limits.
+
+    This is a problem with the submitted points, not a server fault, so the API reports it as a
+    client error.
+    """
+
+
 def compute_mst(request: OptimizationRequest) -> Dict[str, Any]:
     """Compute a realistic power distribution network using MST with intermediate poles.
 
@@ -41,64 +47,62 @@ def compute_mst(request: OptimizationRequest) -> Dict[str, Any]:
         pole_start_idx = len(coords)
 
     # ─── Build & compute MST ────────────────────────────────────────────────
-    dist_matrix = cdist(
-        extended_coords,
-        extended_coords,
-        metric=lambda u, v: haversine_meters(u[0], u[1], v[0], v[1])
-    )
-
-    DG = build_directed_graph_for_arborescence(
+    candidate_edges = build_candidate_edges(
         source_idx=source_idx,
         terminal_indices=terminal_indices,
         pole_indices=pole_indices,
-        dist_matrix=dist_matrix,  # you already compute this
+        coords=extended_coords,
         costs=costs,
     )
 
-    arbo = nx.minimum_spanning_arborescence(DG, attr="weight", preserve_attrs=True, default=1e18)
+    parent, edge_length, edge_voltage = build_rooted_mst(candidate_edges, len(extended_coords), source_idx)
+
+    # ─── Feasibility: terminals the source cannot reach ────────────────────
+    # A network that silently leaves terminals out would understate the cost, so fail the
+    # request instead, naming the terminals that cannot be connected
+    terminals = np.asarray(terminal_indices, dtype=np.int64)
+    unreachable = terminals[parent[terminals] < 0]
+    if len(unreachable):
+        raise InfeasibleNetworkError(
+            f"{len(unreachable)} of {len(terminals)} terminal(s) cannot be reached from the power "
+            f"source within the span limits: {', '.join(original_names[i] for i in unreachable)}"
+        )
 
     # ─── Remove 0 degree poles ────────────────────────────────────────────────
-    mst = prune_dead_end_pole_branches(arbo, pole_indices, terminal_indices)
+    parent = prune_dead_end_pole_branches(parent, terminal_indices)
+    children = np.flatnonzero(parent >= 0)
 
     # ─── Extract used nodes & name poles ────────────────────────────────────
-    used_nodes = {u for u, v in mst.edges()} | {v for u, v in mst.edges()}
-    used_pole_indices = [i for i in pole_indices if i in used_nodes]
+    # Sorted unique endpoints of the pruned tree; poles are every index from pole_start_idx
+    used_nodes = np.union1d(children, parent[children])
+    used_pole_indices = used_nodes[used_nodes >= pole_start_idx].tolist()
 
-    node_names = dict(enumerate(original_names))
+    # Node indices are dense (terminals first, then candidate poles), so index a list directly
+    node_names = list(original_names) + [f"Unused {i}" for i in pole_indices]
     for idx, pole_i in enumerate(used_pole_indices, 1):
         node_names[pole_i] = f"Pole {idx}"
 
     # ─── Collect edges & totals ─────────────────────────────────────────────
-    edges = []
-    total_low_m = 0.0
-    total_high_m = 0.0
-
-    for u, v, data in mst.edges(data=True):
-        length_m = data.get("length")
-        voltage = data.get("voltage")
-
-        start_name = node_names.get(u, f"Node {u}")
-        end_name = node_names.get(v, f"Node {v}")
-
-        edges.append({
-            "start": {
-                "lat": float(extended_coords[u][0]),
-                "lng": float(extended_coords[u][1]),
-                "name": start_name
-            },
-            "end": {
-                "lat": float(extended_coords[v][0]),
-                "lng": float(extended_coords[v][1]),
-                "name": end_name
-            },
-            "lengthMeters": round(length_m, 2),
+    starts = parent[children]
+    start_coords = extended_coords[starts].tolist()
+    end_coords = extended_coords[children].tolist()
+    lengths_m = np.round(edge_length[children], 2).tolist()
+    voltages = edge_voltage[children].tolist()
+
+    edges = [
+        {
+            "start": {"lat": start_lat, "lng": start_lng, "name": node_names[u]},
+            "end": {"lat": end_lat, "lng": end_lng, "name": node_names[v]},
+            "lengthMeters": length_m,
             "voltage": voltage,
-        })
+        }
+        for u, v, (start_lat, start_lng), (end_lat, end_lng), length_m, voltage in zip(
+            starts.tolist(), children.tolist(), start_coords, end_coords, lengths_m, voltages
+        )
+    ]
 
-        if voltage == "low":
-            total_low_m += length_m
-        else:
-            total_high_m += length_m
+    total_low_m = float(edge_length[children][edge_voltage[children] == "low"].sum())
+    total_high_m = float(edge_length[children][edge_voltage[children] == "high"].sum())
 
     # ─── Cost calculation ───────────────────────────────────────────────────
     pole_cost = float(costs.get("poleCost", 1500.0))
@@ -130,10 +134,10 @@ def compute_mst(request: OptimizationRequest) -> Dict[str, Any]:
                 "index": i,
                 "lat": float(extended_coords[i][0]),
                 "lng": float(extended_coords[i][1]),
-                "name": node_names.get(i, f"Unused {i}"),
+                "name": node_names[i],
                 "type": "source" if i == source_idx else "terminal" if i < pole_start_idx else "pole"
             }
-            for i in sorted(used_nodes)
+            for i in used_nodes.tolist()
         ]
 
     return {
@@ -149,7 +153,7 @@ def compute_mst(request: OptimizationRequest) -> Dict[str, Any]:
         "totalCostEstimate": round(total_cost_est, 2),
         "debug": {
             "sourceIndex": source_idx,
-            "sourceName": node_names.get(source_idx, "Power Source"),
+            "sourceName": node_names[source_idx],
             "originalPoints": len(coords),
             "candidatesGenerated": len(candidates),
             "candidatesUsed": num_poles,
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from mst import compute_mst, OptimizationRequest
+from mst import compute_mst, InfeasibleNetworkError, OptimizationRequest
 
 app = FastAPI(title="Renewvia MST Optimizer")
 
@@ -23,7 +24,11 @@ async def optimize(request: OptimizationRequest):
         raise HTTPException(status_code=400, detail="Need at least 2 points")
 
     try:
-        result = compute_mst(request)
+        # CPU-bound solve runs off the event loop so other requests keep being served
+        result = await run_in_threadpool(compute_mst, request)
         return result
+    except InfeasibleNetworkError as e:
+        # The layout itself cannot be served; report it as a problem with the input
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
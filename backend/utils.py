@@ -1,6 +1,7 @@
 import math
+import re
 import numpy as np
-from typing import Dict, Union, Any, List
+from typing import Dict, Union, Any, List, NamedTuple
 
 from pydantic import BaseModel
 
@@ -18,6 +19,15 @@ class OptimizationRequest(BaseModel):
     debug: bool = False
 
 
+SOURCE_KEYWORDS = {
+    "power source", "powersource", "source", "substation", "main source",
+    "primary", "generator", "grid tie", "utility"
+}
+
+# Single case-insensitive pass over a name instead of one substring scan per keyword
+SOURCE_RE = re.compile("|".join(re.escape(kw) for kw in sorted(SOURCE_KEYWORDS)), re.IGNORECASE)
+
+
 def parse_input(request: OptimizationRequest):
     """
     Parses input request containing information about geographical points, costs, and their attributes to generate structured
@@ -41,43 +51,45 @@ def parse_input(request: OptimizationRequest):
     if len(points) < 2:
         raise ValueError("At least 2 points required")
 
-    coords_list = []
+    # Coordinates go straight into flat float64 columns
+    try:
+        lats = np.fromiter((float(p["lat"]) for p in points), dtype=np.float64, count=len(points))
+        lngs = np.fromiter((float(p["lng"]) for p in points), dtype=np.float64, count=len(points))
+    except (KeyError, TypeError, ValueError):
+        # Re-scan only on failure, to name the offending point
+        for i, p in enumerate(points):
+            try:
+                float(p["lat"])
+                float(p["lng"])
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Point {i + 1} missing/invalid lat/lng: {p}") from e
+        raise
+
+    # Written as "inside" so NaN coordinates are rejected too
+    valid = (lats >= -90) & (lats <= 90) & (lngs >= -180) & (lngs <= 180)
+    if not valid.all():
+        i = int(np.flatnonzero(~valid)[0])
+        raise ValueError(f"Point {i + 1} has invalid coordinates: ({lats[i]}, {lngs[i]})")
+
+    coords = np.column_stack([lats, lngs])
+
     names = []
     source_idx = None
 
-    SOURCE_KEYWORDS = {
-        "power source", "powersource", "source", "substation", "main source",
-        "primary", "generator", "grid tie", "utility"
-    }
-
     for i, p in enumerate(points):
-        try:
-            lat = float(p["lat"])
-            lng = float(p["lng"])
-        except (KeyError, TypeError, ValueError) as e:
-            raise ValueError(f"Point {i + 1} missing/invalid lat/lng: {p}") from e
-
-        if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
-            raise ValueError(f"Point {i + 1} has invalid coordinates: ({lat}, {lng})")
-
-        coords_list.append([lat, lng])
-
         # Name handling
         raw_name = p.get("name")
         name = str(raw_name).strip() if raw_name is not None else f"Location {i + 1}"
         names.append(name)
 
         # Source detection (case-insensitive, more flexible)
-        name_lower = name.lower()
-        if any(kw in name_lower for kw in SOURCE_KEYWORDS) or "source" in name_lower:
+        if SOURCE_RE.search(name):
             if source_idx is not None:
                 print(f"Warning: Multiple potential sources detected; using first (index {source_idx})")
             else:
                 source_idx = i
                 names[i] = "Power Source"  # canonical name
 
-    coords = np.array(coords_list, dtype=np.float64)
-
     if source_idx is None:
         print("No explicit power source found → using first point (index 0)")
         source_idx = 0
@@ -109,19 +121,136 @@ def haversine_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> floa
     dlam = math.radians(lng2 - lng1)
 
     a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlam / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    c = 2 * math.asin(math.sqrt(a))
     return R * c
 
 
+def haversine_from_radians(lat1, lng1, cos_lat1, lat2, lng2, cos_lat2):
+    """Haversine distance in meters from coordinates already converted to radians.
+
+    Works element-wise on scalars or broadcastable arrays. Callers that measure the same points
+    repeatedly convert them (and their cos(lat)) once and reuse the results here.
+
+    Args:
+        lat1, lng1: Latitude/longitude of the first point(s) in radians.
+        cos_lat1: cos(lat1).
+        lat2, lng2: Latitude/longitude of the second point(s) in radians.
+        cos_lat2: cos(lat2).
+
+    Returns:
+        Distance(s) in meters, broadcast over the inputs.
+    """
+    # Terms are squared and scaled in place so a broadcast builds only a couple of full-size
+    # temporaries instead of one per operation
+    a = np.sin((lat2 - lat1) * 0.5)
+    a *= a
+    b = np.sin((lng2 - lng1) * 0.5)
+    b *= b
+    b *= cos_lat1
+    b *= cos_lat2
+    a += b
+
+    d = np.arcsin(np.sqrt(a))
+    d *= 2 * 6371000.0
+    return d
+
+
+class PreparedPoints(NamedTuple):
+    """Per-point trig table for repeated haversine evaluations over the same points.
+
+    Args:
+        lat: Latitudes in radians.
+        lng: Longitudes in radians.
+        cos_lat: cos(lat), the factor otherwise recomputed for every pair a point is in.
+    """
+    lat: np.ndarray
+    lng: np.ndarray
+    cos_lat: np.ndarray
+
+
+def prepare_points(coords) -> PreparedPoints:
+    """Convert (n, 2) [lat, lon] degrees to a `PreparedPoints` table, once per point."""
+    coords = np.asarray(coords, dtype=np.float64)
+    lat = np.radians(coords[:, 0])
+    return PreparedPoints(lat=lat, lng=np.radians(coords[:, 1]), cos_lat=np.cos(lat))
+
+
+def haversine_prepared(points: PreparedPoints, i, j):
+    """Haversine distance in meters between points[i] and points[j] (indices or index arrays)."""
+    return haversine_from_radians(
+        points.lat[i], points.lng[i], points.cos_lat[i],
+        points.lat[j], points.lng[j], points.cos_lat[j],
+    )
+
+
 def haversine_vec(A, B):
-    # A, B: (n, 2) arrays of [lat, lon]
-    lat1, lon1 = np.radians(A[:, 0]), np.radians(A[:, 1])
-    lat2, lon2 = np.radians(B[:, 0]), np.radians(B[:, 1])
-    dlat = lat2 - lat1[:, None]
-    dlon = lon2 - lon1[:, None]
-    a = np.sin(dlat / 2) ** 2 + np.cos(lat1[:, None]) * np.cos(lat2) * np.sin(dlon / 2) ** 2
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-    return 6371000 * c  # shape (n_candidates, n_buildings)
+    """Pairwise haversine distances in meters between two sets of points.
+
+    Args:
+        A: (n, 2) array of [lat, lon] in degrees.
+        B: (m, 2) array of [lat, lon] in degrees.
+
+    Returns:
+        np.ndarray: (n, m) matrix where entry [i, j] is the distance from A[i] to B[j].
+    """
+    P = prepare_points(A)
+    Q = prepare_points(B)
+
+    # Rows index A, columns index B; cos(lat) is taken once per point before broadcasting
+    return haversine_from_radians(
+        P.lat[:, None], P.lng[:, None], P.cos_lat[:, None],
+        Q.lat[None, :], Q.lng[None, :], Q.cos_lat[None, :],
+    )
+
+
+def project_to_local_meters(coords, origin=None):
+    """
+    Project [lat, lon] points to local x/y meters with an equirectangular projection.
+
+    At mini-grid scale (a few km) planar distances between projected points closely match
+    haversine distances, which makes them suitable for KD-tree neighbour searches. Exact
+    distances should still be taken with haversine on the pairs a search returns.
+
+    Args:
+        coords: np.ndarray of shape (n, 2) where each row is [latitude, longitude]
+        origin: optional [lat, lon] projection origin; defaults to the centroid of coords
+
+    Returns:
+        np.ndarray: (n, 2) array of [x, y] meters (x east, y north) relative to origin
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if origin is None:
+        origin = coords.mean(axis=0)
+
+    R = 6371000.0  # Earth mean radius in meters
+    x = R * np.radians(coords[:, 1] - origin[1]) * np.cos(np.radians(origin[0]))
+    y = R * np.radians(coords[:, 0] - origin[0])
+    return np.column_stack([x, y])
+
+
+def projection_search_radius(coords, radius: float, origin=None) -> float:
+    """
+    Widen a true-distance radius so a search on `project_to_local_meters` output misses no pair.
+
+    The projection scales east-west distances by cos(lat) at the origin, so between points
+    further from the equator than the origin projected distances exceed true ones by up to
+    cos(lat0) / cos(lat). The radius is widened by that worst stretch across `coords` plus a
+    1% margin; callers then filter the returned pairs by exact haversine distance.
+
+    Args:
+        coords: np.ndarray of shape (n, 2) where each row is [latitude, longitude]
+        radius: true search radius in meters
+        origin: the projection origin used; defaults to the centroid of coords
+
+    Returns:
+        float: search radius in projected meters
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if origin is None:
+        origin = coords.mean(axis=0)
+
+    stretch = np.cos(np.radians(origin[0])) / np.cos(np.radians(coords[:, 0])).min()
+    return 1.01 * max(1.0, float(stretch)) * radius
 
 
 def build_bounding_box(coords):